@@ -1,29 +1,292 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import os
-from PIL import Image, ImageTk, ImageDraw, ImageFont
+from PIL import Image, ImageTk, ImageDraw, ImageFont, ImageColor
 import tempfile
 import subprocess
-import win32print
 import sys
 from datetime import datetime
 import json
 import glob
 import zipfile
+import shutil
+import time
+import math
+import argparse
+import zlib
+import tracemalloc
 import xml.etree.ElementTree as ET
 
+try:
+    import win32print
+except ImportError:
+    # 非Windows环境（如Linux上的回放压测）没有win32print
+    win32print = None
+
+try:
+    import numpy as np
+except ImportError:
+    # 缺少numpy时跳过打印前条码校验
+    np = None
+
+try:
+    import win32api
+    import win32process
+except ImportError:
+    win32api = None
+    win32process = None
+
+
+CODE128_PATTERNS = [
+    "212222", "222122", "222221", "121223", "121322", "131222", "122213", "122312", "132212", "221213",
+    "221312", "231212", "112232", "122132", "122231", "113222", "123122", "123221", "223211", "221132",
+    "221231", "213212", "223112", "312131", "311222", "321122", "321221", "312212", "322112", "322211",
+    "212123", "212321", "232121", "111323", "131123", "131321", "112313", "132113", "132311", "211313",
+    "231113", "231311", "112133", "112331", "132131", "113123", "113321", "133121", "313121", "211331",
+    "231131", "213113", "213311", "213131", "311123", "311321", "331121", "312113", "312311", "332111",
+    "314111", "221411", "431111", "111224", "111422", "121124", "121421", "141122", "141221", "112214",
+    "112412", "122114", "122411", "142112", "142211", "241211", "221114", "413111", "241112", "134111",
+    "111242", "121142", "121241", "114212", "124112", "124211", "411212", "421112", "421211", "212141",
+    "214121", "412121", "111143", "111341", "131141", "114113", "114311", "411113", "411311", "113141",
+    "114131", "311141", "411131", "211412", "211214", "211232", "2331112"
+]
+
+
+def build_code128_lookup():
+    """按6位条空宽度（5进制）建立码字查找表，未定义的组合为-1"""
+    lookup = np.full(5 ** 6, -1, dtype=np.int16)
+    for code, pattern in enumerate(CODE128_PATTERNS[:106]):
+        key = sum(int(ch) * 5 ** j for j, ch in enumerate(pattern))
+        lookup[key] = code
+    return lookup
+
+
+CODE128_POWERS = np.array([5 ** j for j in range(6)]) if np is not None else None
+CODE128_LOOKUP = build_code128_lookup() if np is not None else None
+
+
+class SimpleVar:
+    """无界面模式下替代tk变量，只提供get/set"""
+    def __init__(self, value=None):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+
+
+class NullPrinter:
+    """空打印后端：不实际打印，只确认PDF可读，用于回放压测"""
+    name = "null"
+
+    def print_pdf(self, pdf_file):
+        os.path.getsize(pdf_file)
+
+
+class FilePrinter:
+    """文件打印后端：把PDF复制到指定目录，代替SumatraPDF"""
+    def __init__(self, sink_dir):
+        self.sink_dir = os.path.abspath(sink_dir)
+        self.name = f"file:{self.sink_dir}"
+        os.makedirs(self.sink_dir, exist_ok=True)
+
+    def print_pdf(self, pdf_file):
+        shutil.copyfile(pdf_file, os.path.join(self.sink_dir, os.path.basename(pdf_file)))
+
+
+class MemoryMonitor:
+    """内存监控：RSS水位采样、tracemalloc快照与分配热点"""
+    def __init__(self, max_snapshots=5):
+        self.peak_rss = 0
+        self.last_snapshot = None
+        # 按需跟踪最多输出的快照次数，达到后自动停止跟踪，避免整班开着tracemalloc
+        self.max_snapshots = max_snapshots
+        self.snapshot_count = 0
+
+    def rss_bytes(self):
+        """当前进程常驻内存（字节），无法获取时返回None"""
+        try:
+            with open('/proc/self/statm', 'r') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError, AttributeError):
+            pass
+        if win32process is not None:
+            try:
+                info = win32process.GetProcessMemoryInfo(win32api.GetCurrentProcess())
+                return info['WorkingSetSize']
+            except Exception:
+                pass
+        return None
+
+    def sample(self):
+        """采样一次RSS并更新峰值水位"""
+        rss = self.rss_bytes()
+        if rss is not None and rss > self.peak_rss:
+            self.peak_rss = rss
+        return rss
+
+    def start_tracing(self, frames=1):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self.snapshot_count = 0
+
+    def stop_tracing(self):
+        """停止tracemalloc并释放保存的快照"""
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.last_snapshot = None
+        self.snapshot_count = 0
+
+    def traced_bytes(self):
+        """tracemalloc统计的当前Python分配量（字节），未开启时返回None"""
+        if not tracemalloc.is_tracing():
+            return None
+        return tracemalloc.get_traced_memory()[0]
+
+    def take_snapshot(self):
+        snapshot = tracemalloc.take_snapshot()
+        return snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ])
+
+    def top_allocations(self, limit=10):
+        """返回分配最多的代码行；已有上一次快照时返回相对上一次的增长"""
+        snapshot = self.take_snapshot()
+        if self.last_snapshot is not None:
+            stats = snapshot.compare_to(self.last_snapshot, 'lineno')
+        else:
+            stats = snapshot.statistics('lineno')
+        self.last_snapshot = snapshot
+        self.snapshot_count += 1
+        return [str(stat) for stat in stats[:limit]]
+
+
+def format_mb(num_bytes):
+    if num_bytes is None:
+        return "未知"
+    return f"{num_bytes / (1024 * 1024):.1f}MB"
+
+
+def pdf_number(value):
+    """PDF数值格式：最多4位小数，去掉多余的0"""
+    return ("%.4f" % value).rstrip("0").rstrip(".").encode("ascii")
+
+
+class LabelPdfWriter:
+    """极简PDF写入器：每页一张整页图片。
+    对象模板预先生成，每页只替换尺寸和图像数据；页面逐页写入文件，close()时写页树、交叉引用表和trailer。"""
+    MM_TO_PT = 72 / 25.4
+    # 对象1为Catalog，对象2为Pages（最后写入），每页依次占用Page、内容流、图像三个对象
+    HEADER = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+    PAGE_TEMPLATE = (b"%d 0 obj\n<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %b %b] "
+                     b"/Resources << /XObject << /Im0 %d 0 R >> >> /Contents %d 0 R >>\nendobj\n")
+    CONTENT_TEMPLATE = b"%d 0 obj\n<< /Length %d >>\nstream\n%b\nendstream\nendobj\n"
+    IMAGE_TEMPLATE = (b"%d 0 obj\n<< /Type /XObject /Subtype /Image /Width %d /Height %d "
+                      b"/ColorSpace /%b /BitsPerComponent 8 /Filter /FlateDecode /Length %d >>\nstream\n")
+    OBJ_END = b"\nendstream\nendobj\n"
+
+    def __init__(self, path, compress_level=1):
+        self.path = path
+        # 标签大部分为白底，压缩级别1已足够小且最快
+        self.compress_level = compress_level
+        self.file = open(path, "wb")
+        self.file.write(self.HEADER)
+        self.offsets = {}
+        self.page_ids = []
+        self.next_id = 3
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def abort(self):
+        """放弃写入：关闭文件并删除未完成的PDF，避免打印出空白页"""
+        if self.file is None:
+            return
+        self.file.close()
+        self.file = None
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def add_image_page(self, img, width_mm, height_mm):
+        """追加一页，图片铺满整页。img为PIL图像（L或RGB）"""
+        if img.mode not in ("L", "RGB"):
+            img = img.convert("RGB")
+        colorspace = b"DeviceGray" if img.mode == "L" else b"DeviceRGB"
+        data = zlib.compress(img.tobytes(), self.compress_level)
+        w = pdf_number(width_mm * self.MM_TO_PT)
+        h = pdf_number(height_mm * self.MM_TO_PT)
+        page_id, content_id, image_id = self.next_id, self.next_id + 1, self.next_id + 2
+        self.next_id += 3
+
+        f = self.file
+        self.offsets[page_id] = f.tell()
+        f.write(self.PAGE_TEMPLATE % (page_id, w, h, image_id, content_id))
+        content = b"q %b 0 0 %b 0 0 cm /Im0 Do Q" % (w, h)
+        self.offsets[content_id] = f.tell()
+        f.write(self.CONTENT_TEMPLATE % (content_id, len(content), content))
+        self.offsets[image_id] = f.tell()
+        f.write(self.IMAGE_TEMPLATE % (image_id, img.width, img.height, colorspace, len(data)))
+        f.write(data)
+        f.write(self.OBJ_END)
+        self.page_ids.append(page_id)
+
+    def close(self):
+        """写入页树、Catalog、交叉引用表和trailer并关闭文件"""
+        if self.file is None:
+            return
+        f = self.file
+        kids = b" ".join(b"%d 0 R" % pid for pid in self.page_ids)
+        self.offsets[2] = f.tell()
+        f.write(b"2 0 obj\n<< /Type /Pages /Kids [%b] /Count %d >>\nendobj\n" % (kids, len(self.page_ids)))
+        self.offsets[1] = f.tell()
+        f.write(b"1 0 obj\n<< /Type /Catalog /Pages 2 0 R >>\nendobj\n")
+        xref_pos = f.tell()
+        count = self.next_id
+        lines = [b"xref\n0 %d\n" % count, b"0000000000 65535 f \n"]
+        for obj_id in range(1, count):
+            lines.append(b"%010d 00000 n \n" % self.offsets[obj_id])
+        f.write(b"".join(lines))
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (count, xref_pos))
+        f.close()
+        self.file = None
+
+
 class BarcodeLabelTool:
-    def __init__(self, root):
+    def __init__(self, root=None, printer_backend=None):
+        # root为None时以无界面模式运行（不创建任何Tk控件，用于回放压测）
         self.root = root
-        self.root.title("扫码出标签工具")
-        self.root.geometry("800x600")
+        self.headless = root is None
+        # 打印后端为None时使用SumatraPDF，否则交给后端处理
+        self.printer_backend = printer_backend
+        # 无界面模式下日志写入该流（为None则丢弃）
+        self.log_stream = None
+        # 日志窗口最多保留的行数，避免整班运行后Text控件无限增长
+        self.max_log_lines = 2000
+        # 内存监控：定期记录RSS水位（毫秒）
+        self.memory_monitor = MemoryMonitor()
+        self.memory_log_interval_ms = 10 * 60 * 1000
+        if not self.headless:
+            self.root.title("扫码出标签工具")
+            self.root.geometry("800x600")
         
         # 数据存储
         self.data = None
         self.data_columns = []
         self.order_column = None
         self.tracking_column = None
-        self.auto_print = tk.BooleanVar(value=True)  # 默认开启自动打印
+        self.auto_print = self.make_var(tk.BooleanVar, True)  # 默认开启自动打印
         
         # DPI设置 (用于毫米到像素的转换)
         self.dpi = 300  # 标准打印DPI
@@ -40,6 +303,9 @@ class BarcodeLabelTool:
         self.barcode_height_mm = 20
         self.top_margin_mm = 10
         self.barcode_density_scale = 1.6
+        # 打印前解码校验条码，最小模块宽度（像素），低于该值视为条空可能粘连
+        self.verify_barcodes = True
+        self.min_module_px = 2
 
         # 文字显示配置（独立于条码自带文本）
         self.text_font_size_pt = 20  # 字号为20
@@ -47,10 +313,20 @@ class BarcodeLabelTool:
         self.text_color = 'black'    # 文字颜色
         
         # 创建界面
-        self.create_widgets()
+        if self.headless:
+            self.create_headless_state()
+        else:
+            self.create_widgets()
         
         # 启动时清理非当天文件
         self.cleanup_old_files()
+
+        if self.verify_barcodes and np is None:
+            self.log_event("警告：未安装numpy，打印前条码校验已关闭（pip install numpy）")
+
+        # 定期记录内存水位
+        if not self.headless:
+            self.root.after(self.memory_log_interval_ms, self.schedule_memory_log)
         
     def cleanup_old_files(self):
         """清理非当天的条码文件"""
@@ -90,6 +366,22 @@ class BarcodeLabelTool:
         except Exception as e:
             self.log_event(f"清理旧文件时出错: {str(e)}")
         
+    def make_var(self, var_cls, value):
+        """创建界面变量，无界面模式下使用SimpleVar"""
+        if self.headless:
+            return SimpleVar(value)
+        return var_cls(value=value)
+
+    def create_headless_state(self):
+        """无界面模式下初始化扫码流程依赖的状态（替代create_widgets）"""
+        self.scan_entry = None
+        self.tracking_var = SimpleVar("")
+        self.label_format_var = SimpleVar("100x100")
+        self.actual_size_label = None
+        # 打印机名称由打印后端决定
+        backend_name = self.printer_backend.name if self.printer_backend is not None else ""
+        self.printer_combo = SimpleVar(backend_name)
+
     def mm_to_pixels(self, mm):
         """将毫米转换为像素"""
         # 使用四舍五入提高尺寸精度，保证打印物理尺寸更贴近设定值
@@ -184,6 +476,7 @@ class BarcodeLabelTool:
 
         ttk.Button(print_settings, text="手动打印条形码", command=self.print_barcode).grid(row=1, column=2, pady=(6,0))
         ttk.Button(print_settings, text="保存当前配置", command=self.save_config).grid(row=1, column=3, pady=(6,0))
+        ttk.Button(print_settings, text="内存快照", command=self.log_memory_snapshot).grid(row=1, column=4, padx=(10, 0), pady=(6,0))
 
         # 日志区域（移除预览，仅显示日志）
         log_frame = ttk.LabelFrame(main_frame, text="日志", padding="8")
@@ -307,15 +600,7 @@ class BarcodeLabelTool:
                 self.data_columns = headers
                 self.file_label.config(text=os.path.basename(file_path))
                 
-                self.order_column = None
-                self.tracking_column = None
-                
-                for col in headers:
-                    col_lower = col.lower()
-                    if any(keyword in col_lower for keyword in ['订单', 'order', '编号', 'id']):
-                        self.order_column = col
-                    elif any(keyword in col_lower for keyword in ['转单', 'tracking', '快递', '运单']):
-                        self.tracking_column = col
+                self.order_column, self.tracking_column = self.detect_columns(headers)
                 
                 self.mapping_frame.grid()
                 
@@ -333,6 +618,18 @@ class BarcodeLabelTool:
             except Exception as e:
                 self.log_event(f"导入文件失败: {str(e)}")
     
+    def detect_columns(self, headers):
+        """根据表头关键字猜测订单号列和转单号列"""
+        order_column = None
+        tracking_column = None
+        for col in headers:
+            col_lower = col.lower()
+            if any(keyword in col_lower for keyword in ['订单', 'order', '编号', 'id']):
+                order_column = col
+            elif any(keyword in col_lower for keyword in ['转单', 'tracking', '快递', '运单']):
+                tracking_column = col
+        return order_column, tracking_column
+
     def confirm_mapping(self):
         self.order_column = self.order_combo.get()
         self.tracking_column = self.tracking_combo.get()
@@ -357,30 +654,34 @@ class BarcodeLabelTool:
                 return row
         return None
     
-    def process_scan(self, event=None):
+    def process_scan(self, event=None, order_number=None):
+        """处理一次扫码。order_number为None时从输入框读取。成功返回True，失败返回False"""
         self.last_action_start = datetime.now()
         if not self.data:
             self.log_event("错误：请先导入Excel文件")
-            return
+            return False
             
         if not self.order_column or not self.tracking_column:
             self.log_event("错误：请先设置列映射")
-            return
+            return False
             
-        order_number = self.scan_entry.get().strip()
+        from_entry = order_number is None
+        if from_entry:
+            order_number = self.scan_entry.get()
+        order_number = order_number.strip()
         if not order_number:
             self.log_event("错误：请输入订单号")
-            return
+            return False
             
         row = self.find_row_by_order(order_number)
         if row is None:
             self.log_event(f"错误：未找到订单号: {order_number}")
-            return
+            return False
             
         tracking_number = str(row.get(self.tracking_column, "")).strip()
         if not tracking_number:
             self.log_event(f"错误：订单号 {order_number} 的转单号为空")
-            return
+            return False
         self.tracking_var.set(tracking_number)
         self.last_tracking_number = tracking_number
         
@@ -391,10 +692,12 @@ class BarcodeLabelTool:
         
         # 如果启用了自动打印，且生成成功，再打印
         if success and self.auto_print.get():
-            self.print_barcode()
+            success = self.print_barcode()
         
         # 清空扫描输入框，准备下一次扫描
-        self.scan_entry.delete(0, tk.END)
+        if from_entry:
+            self.scan_entry.delete(0, tk.END)
+        return success
     
     def generate_label(self, tracking_number):
         """生成完整的标签图片和PDF。成功返回True，失败返回False"""
@@ -431,9 +734,8 @@ class BarcodeLabelTool:
             self.log_event(f"生成条形码失败: {str(e)}")
             return False
 
-    def create_code128_barcode_pil(self, value, out_png):
-        """使用 Pillow 绘制 Code128 条码 PNG（不带文字）"""
-        text = str(value)
+    def encode_code128(self, text):
+        """把数字串编码为Code128码字序列（含起始符、校验位和终止符）"""
         if not text:
             raise ValueError("Code128编码内容不能为空")
         if not text.isdigit():
@@ -461,39 +763,31 @@ class BarcodeLabelTool:
             checksum += code * i
         checksum %= 103
 
-        sequence = codes + [checksum, 106]
-
-        patterns = [
-            "212222", "222122", "222221", "121223", "121322", "131222", "122213", "122312", "132212", "221213",
-            "221312", "231212", "112232", "122132", "122231", "113222", "123122", "123221", "223211", "221132",
-            "221231", "213212", "223112", "312131", "311222", "321122", "321221", "312212", "322112", "322211",
-            "212123", "212321", "232121", "111323", "131123", "131321", "112313", "132113", "132311", "211313",
-            "231113", "231311", "112133", "112331", "132131", "113123", "113321", "133121", "313121", "211331",
-            "231131", "213113", "213311", "213131", "311123", "311321", "331121", "312113", "312311", "332111",
-            "314111", "221411", "431111", "111224", "111422", "121124", "121421", "141122", "141221", "112214",
-            "112412", "122114", "122411", "142112", "142211", "241211", "221114", "413111", "241112", "134111",
-            "111242", "121142", "121241", "114212", "124112", "124211", "411212", "421112", "421211", "212141",
-            "214121", "412121", "111143", "111341", "131141", "114113", "114311", "411113", "411311", "113141",
-            "114131", "311141", "411131", "211412", "211214", "211232", "2331112"
-        ]
+        return codes + [checksum, 106]
 
+    def render_code128(self, sequence, integer_modules=False):
+        """绘制码字序列为条码图片。
+        integer_modules为True时每个模块取整数像素宽度并居中，避免小数模块经四舍五入后条空粘连"""
         width_px = self.mm_to_pixels(self.barcode_width_mm)
         height_px = self.mm_to_pixels(self.barcode_height_mm)
 
         quiet_modules = 10
         total_modules = quiet_modules * 2
         for code in sequence:
-            pattern = patterns[code]
+            pattern = CODE128_PATTERNS[code]
             total_modules += sum(int(x) for x in pattern)
 
         module_px = width_px / float(total_modules)
+        xf = quiet_modules * module_px
+        if integer_modules:
+            module_px = max(1, int(module_px))
+            xf = (width_px - (total_modules - quiet_modules * 2) * module_px) // 2
 
         img = Image.new('RGB', (width_px, height_px), 'white')
         draw = ImageDraw.Draw(img)
 
-        xf = quiet_modules * module_px
         for code in sequence:
-            pattern = patterns[code]
+            pattern = CODE128_PATTERNS[code]
             for i, ch in enumerate(pattern):
                 units = int(ch)
                 next_xf = xf + units * module_px
@@ -502,6 +796,82 @@ class BarcodeLabelTool:
                 if i % 2 == 0 and xj > xi:
                     draw.rectangle([xi, 0, xj - 1, height_px - 1], fill="black")
                 xf = next_xf
+        return img
+
+    def verify_code128_image(self, img, expected):
+        """解码条码图片中间一行，校验内容、校验位、静区和最小模块宽度。
+        通过返回None，否则返回失败原因"""
+        width, height = img.size
+        y = height // 2
+        row = np.asarray(img.crop((0, y, width, y + 1)).convert('L')).reshape(-1)
+        dark = row < 128
+        # 游程编码：相邻像素颜色变化处即为条/空边界
+        bounds = np.concatenate(([0], np.flatnonzero(dark[1:] != dark[:-1]) + 1, [width]))
+        runs = np.diff(bounds)
+        if dark[0] or dark[-1]:
+            return "条码缺少静区"
+        quiet_left, quiet_right = runs[0], runs[-1]
+        runs = runs[1:-1]
+        if len(runs) < 13 or (len(runs) - 7) % 6 != 0:
+            return f"条空数量异常({len(runs)})"
+
+        symbols = (len(runs) - 7) // 6
+        module_px = runs.sum() / float(symbols * 11 + 13)
+        units = runs / module_px
+        digits = np.rint(units)
+        if digits.min() < 1 or digits.max() > 4 or np.abs(units - digits).max() > 0.4:
+            return "条空宽度偏差过大"
+        narrow = runs[digits == 1].min()
+        if narrow < self.min_module_px:
+            return f"最小模块宽度{narrow}px小于{self.min_module_px}px"
+        if min(quiet_left, quiet_right) < 10 * module_px - 1:
+            return "静区不足10个模块"
+
+        digits = digits.astype(np.int64)
+        if CODE128_PATTERNS[106] != "".join(str(d) for d in digits[-7:]):
+            return "终止符错误"
+        codes = CODE128_LOOKUP[digits[:-7].reshape(symbols, 6) @ CODE128_POWERS]
+        if (codes < 0).any():
+            return "存在无法识别的码字"
+
+        codes = codes.tolist()
+        checksum = codes[0]
+        for i, code in enumerate(codes[1:-1], start=1):
+            checksum += code * i
+        if checksum % 103 != codes[-1]:
+            return "校验位错误"
+
+        subset = {105: "C", 104: "B"}.get(codes[0])
+        if subset is None:
+            return "起始符错误"
+        chars = []
+        for code in codes[1:-1]:
+            if code == 100:
+                subset = "B"
+            elif subset == "C":
+                chars.append(f"{code:02d}")
+            else:
+                chars.append(chr(code + 32))
+        decoded = "".join(chars)
+        if decoded != expected:
+            return f"解码内容不一致({decoded})"
+        return None
+
+    def create_code128_barcode_pil(self, value, out_png):
+        """使用 Pillow 绘制 Code128 条码 PNG（不带文字）。
+        开启校验时先解码验证，失败则按整数模块宽度重绘，仍失败则抛出异常，避免打出坏标签"""
+        text = str(value)
+        sequence = self.encode_code128(text)
+        img = self.render_code128(sequence)
+
+        if self.verify_barcodes and np is not None:
+            reason = self.verify_code128_image(img, text)
+            if reason is not None:
+                self.log_event(f"条码校验失败({reason})，按整数模块宽度重新绘制: {text}")
+                img = self.render_code128(sequence, integer_modules=True)
+                reason = self.verify_code128_image(img, text)
+                if reason is not None:
+                    raise ValueError(f"条码校验失败: {reason}")
 
         img.save(out_png, dpi=(self.dpi, self.dpi))
 
@@ -513,7 +883,8 @@ class BarcodeLabelTool:
         label_width_mm, label_height_mm = self.label_sizes[self.label_format_var.get()]
         
         # 更新实际尺寸显示
-        self.actual_size_label.config(text=f"{label_width_mm}x{label_height_mm}")
+        if self.actual_size_label is not None:
+            self.actual_size_label.config(text=f"{label_width_mm}x{label_height_mm}")
         
         # 转换为像素
         label_width_px = self.mm_to_pixels(label_width_mm)
@@ -522,16 +893,15 @@ class BarcodeLabelTool:
         # 创建标签画布
         label_img = Image.new('RGB', (label_width_px, label_height_px), 'white')
         
-        # 加载条形码图片
-        barcode_img = Image.open(barcode_file)
-        
         # 转换为像素
         barcode_width_px = self.mm_to_pixels(self.barcode_width_mm)
         barcode_height_px = self.mm_to_pixels(self.barcode_height_mm)
         
-        # 将条形码调整到固定尺寸，优先保证横向尺寸为80mm
+        # 加载条形码图片，并调整到固定尺寸，优先保证横向尺寸为80mm
         # 使用NEAREST避免抗锯齿造成的条纹模糊，提升扫码成功率
-        barcode_img = barcode_img.resize((barcode_width_px, barcode_height_px), Image.NEAREST)
+        # 用with及时关闭文件句柄并释放解码缓冲
+        with Image.open(barcode_file) as src_img:
+            barcode_img = src_img.resize((barcode_width_px, barcode_height_px), Image.NEAREST)
         
         # 计算水平居中位置和上部位置 (毫米)
         top_margin_px = self.mm_to_pixels(self.top_margin_mm)
@@ -570,30 +940,21 @@ class BarcodeLabelTool:
         self.create_pdf_label(label_img, tracking_number, label_width_mm, label_height_mm)
     
     def create_pdf_label(self, label_img, tracking_number, width_mm, height_mm):
-        """创建PDF版本的标签"""
+        """创建PDF版本的标签。失败时不留下PDF文件，并向上抛出异常使本次生成失败"""
         try:
-            # 导入reportlab库
-            from reportlab.pdfgen import canvas
-            from reportlab.lib.pagesizes import mm
-            from reportlab.lib.utils import ImageReader
-            
-            # 创建PDF文件
             pdf_filename = f"label_{tracking_number}.pdf"
-            c = canvas.Canvas(pdf_filename, pagesize=(width_mm*mm, height_mm*mm))
-            
-            # 将PIL图像转换为reportlab可用的图像
-            img_reader = ImageReader(label_img)
+            # 文字为灰度色时整张标签只有黑白灰，转为灰度图可减小2/3的图像数据
+            r, g, b = ImageColor.getrgb(self.text_color)[:3]
+            if label_img.mode == 'RGB' and r == g == b:
+                label_img = label_img.convert('L')
             
-            # 在PDF上绘制图像，填满整个页面
-            c.drawImage(img_reader, 0, 0, width=width_mm*mm, height=height_mm*mm)
+            # 图片填满整个页面
+            with LabelPdfWriter(pdf_filename) as pdf:
+                pdf.add_image_page(label_img, width_mm, height_mm)
             
-            # 保存PDF
-            c.save()
-            
-        except ImportError:
-            self.log_event("错误：请安装reportlab库: pip install reportlab")
         except Exception as e:
             self.log_event(f"创建PDF失败: {str(e)}")
+            raise
     
     def update_preview(self, event=None):
         """更新实际尺寸文本显示。"""
@@ -654,6 +1015,9 @@ class BarcodeLabelTool:
     
     def load_printers(self):
         printers = []
+        if win32print is None:
+            self.log_event("错误：缺少pywin32，无法获取打印机列表")
+            return
         try:
             for printer in win32print.EnumPrinters(win32print.PRINTER_ENUM_LOCAL):
                 printers.append(printer[2])
@@ -664,20 +1028,31 @@ class BarcodeLabelTool:
             self.log_event("错误：无法获取打印机列表")
     
     def print_barcode(self):
+        """打印当前转单号的PDF标签。发送成功返回True，失败返回False"""
         tracking_number = self.tracking_var.get()
         if not tracking_number:
             self.log_event("错误：没有可打印的条形码")
-            return
+            return False
             
         printer_name = self.printer_combo.get()
         if not printer_name:
             self.log_event("错误：请选择打印机")
-            return
+            return False
             
         pdf_file = f"label_{tracking_number}.pdf"
         if not os.path.exists(pdf_file):
             self.log_event("错误：PDF文件不存在")
-            return
+            return False
+
+        # 指定了打印后端时不调用SumatraPDF
+        if self.printer_backend is not None:
+            try:
+                self.printer_backend.print_pdf(pdf_file)
+                self.log_event(f"打印任务已发送: {tracking_number} -> {printer_name}")
+                return True
+            except Exception as e:
+                self.log_event(f"打印失败: {pdf_file}，错误: {str(e)}")
+                return False
             
         # 获取程序所在目录
         if getattr(sys, 'frozen', False):
@@ -691,7 +1066,7 @@ class BarcodeLabelTool:
         
         if not os.path.exists(sumatra_path):
             self.log_event(f"错误：SumatraPDF.exe不存在于程序目录: {sumatra_path}")
-            return
+            return False
             
         try:
             # 使用SumatraPDF静默打印
@@ -718,15 +1093,17 @@ class BarcodeLabelTool:
                     self.log_event(f"打印条码 {tracking_number} 到打印机 {printer_name}，耗时 {elapsed:.2f}s")
                 else:
                     self.log_event(f"打印条码 {tracking_number} 到打印机 {printer_name}")
+                return True
             else:
                 # 如果打印失败，尝试使用默认打印机
                 self.log_event(f"打印到指定打印机失败，尝试使用默认打印机: {result.stderr}")
-                self.print_with_default_printer(pdf_file, sumatra_path)
+                return self.print_with_default_printer(pdf_file, sumatra_path)
             
         except subprocess.TimeoutExpired:
             self.log_event(f"打印超时: {pdf_file}")
         except Exception as e:
             self.log_event(f"打印失败: {pdf_file}，错误: {str(e)}")
+        return False
     
     def print_with_default_printer(self, pdf_file, sumatra_path):
         """使用默认打印机打印"""
@@ -742,25 +1119,247 @@ class BarcodeLabelTool:
             
             if result.returncode == 0:
                 self.log_event(f"默认打印机打印成功: {pdf_file}")
-            else:
-                self.log_event(f"默认打印机打印失败: {pdf_file}，错误: {result.stderr}")
+                return True
+            self.log_event(f"默认打印机打印失败: {pdf_file}，错误: {result.stderr}")
         except Exception as e:
             self.log_event(f"默认打印机打印失败: {pdf_file}，异常: {str(e)}")
+        return False
+
+    def log_memory_watermark(self):
+        """记录当前RSS与峰值水位"""
+        rss = self.memory_monitor.sample()
+        rows = len(self.data) if self.data else 0
+        self.log_event(f"内存水位: 当前 {format_mb(rss)}，峰值 {format_mb(self.memory_monitor.peak_rss)}，数据 {rows} 行")
+
+    def schedule_memory_log(self):
+        self.log_memory_watermark()
+        self.root.after(self.memory_log_interval_ms, self.schedule_memory_log)
+
+    def log_memory_snapshot(self):
+        """按需记录tracemalloc快照：首次点击开始跟踪，之后输出相对上一次快照增长最多的分配位置。
+        输出max_snapshots次后自动停止跟踪"""
+        try:
+            monitor = self.memory_monitor
+            self.log_memory_watermark()
+            if not tracemalloc.is_tracing():
+                monitor.start_tracing()
+                monitor.top_allocations()
+                self.log_event(f"已开始内存分配跟踪，再次点击查看分配增长位置（{monitor.max_snapshots}次后自动停止）")
+                return
+            self.log_event(f"Python分配: {format_mb(monitor.traced_bytes())}，分配热点:")
+            for line in monitor.top_allocations():
+                self.log_event(f"  {line}")
+            # 首次点击的基准快照不计入
+            if monitor.snapshot_count > monitor.max_snapshots:
+                monitor.stop_tracing()
+                self.log_event("已停止内存分配跟踪")
+        except Exception as e:
+            self.log_event(f"内存快照失败: {e}")
 
     def log_event(self, text):
         """将事件写入右侧日志窗口，带时间戳"""
         try:
             ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             line = f"[{ts}] {text}\n"
+            if self.log_stream is not None:
+                self.log_stream.write(line)
             if hasattr(self, 'log_text') and self.log_text:
                 self.log_text.config(state=tk.NORMAL)
                 self.log_text.insert(tk.END, line)
+                # 超出上限时删除最早的日志行
+                # end-1c位于末尾换行后的空行，减1得到实际日志行数
+                line_count = int(self.log_text.index('end-1c').split('.')[0]) - 1
+                if line_count > self.max_log_lines:
+                    self.log_text.delete('1.0', f"{line_count - self.max_log_lines + 1}.0")
                 self.log_text.see(tk.END)
                 self.log_text.config(state=tk.DISABLED)
         except Exception:
             pass
 
+
+# ---------------- 回放压测（无界面） ----------------
+
+def load_replay_orders(path):
+    """读取回放文件：每行一个订单号，可用逗号或制表符在后面附带转单号（缺省时转单号=订单号）。
+    返回 (订单号列表, 查找表行列表)"""
+    orders = []
+    table = {}
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            parts = [p.strip() for p in line.replace('\t', ',').split(',')]
+            order_number = parts[0]
+            tracking_number = parts[1] if len(parts) > 1 and parts[1] else order_number
+            orders.append(order_number)
+            table.setdefault(order_number, {"订单号": order_number, "转单号": tracking_number})
+    return orders, list(table.values())
+
+
+def percentile(sorted_values, pct):
+    """最近秩法百分位，输入需已排序"""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def run_replay(app, orders, rate=0.0, on_scan=None):
+    """按固定到达速率（rate>0，单位：次/秒）或尽可能快（rate<=0）回放扫码。
+    到达时间按计划时刻计算，排队延迟=开始处理时刻-到达时刻，延迟=完成时刻-到达时刻。
+    on_scan(已完成扫码数) 在每次扫码后调用（用于浸泡测试采样）。"""
+    latencies = []
+    queue_delays = []
+    failures = 0
+    interval = 1.0 / rate if rate and rate > 0 else 0.0
+    t0 = time.perf_counter()
+    finished = t0
+    for i, order_number in enumerate(orders):
+        if interval:
+            arrival = t0 + i * interval
+            now = time.perf_counter()
+            if now < arrival:
+                time.sleep(arrival - now)
+        else:
+            # 尽可能快：上一单完成即视为下一单到达
+            arrival = finished
+        start = time.perf_counter()
+        if not app.process_scan(order_number=order_number):
+            failures += 1
+        finished = time.perf_counter()
+        queue_delays.append(start - arrival)
+        latencies.append(finished - arrival)
+        if on_scan is not None:
+            on_scan(i + 1)
+    elapsed = finished - t0
+    latencies.sort()
+    queue_delays.sort()
+    count = len(orders)
+    return {
+        'scans': count,
+        'failures': failures,
+        'elapsed_s': elapsed,
+        'throughput_per_s': count / elapsed if elapsed > 0 else 0.0,
+        'queue_delay_mean_ms': 1000 * sum(queue_delays) / count if count else 0.0,
+        'queue_delay_max_ms': 1000 * queue_delays[-1] if count else 0.0,
+        'latency_p50_ms': 1000 * percentile(latencies, 50),
+        'latency_p95_ms': 1000 * percentile(latencies, 95),
+        'latency_p99_ms': 1000 * percentile(latencies, 99),
+        'latency_max_ms': 1000 * latencies[-1] if count else 0.0,
+    }
+
+
+def replay_main(args):
+    """命令行回放入口：不创建Tk窗口，不依赖win32/SumatraPDF"""
+    if args.sink_dir:
+        backend = FilePrinter(args.sink_dir)
+    else:
+        backend = NullPrinter()
+    orders, table = load_replay_orders(args.replay)
+    if not orders:
+        raise SystemExit(f"回放文件中没有订单号: {args.replay}")
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix="label_replay_")
+    os.makedirs(workdir, exist_ok=True)
+    # 相对路径需在切换工作目录前解析
+    excel_path = os.path.abspath(args.excel) if args.excel else None
+    # 标签文件写在当前目录，切换到工作目录避免污染程序目录
+    os.chdir(workdir)
+
+    app = BarcodeLabelTool(printer_backend=backend)
+    if args.verbose:
+        app.log_stream = sys.stderr
+    if excel_path:
+        headers, rows = app.load_xlsx_simple(excel_path)
+        app.data = rows
+        app.data_columns = headers
+        app.order_column, app.tracking_column = app.detect_columns(headers)
+    else:
+        app.data = table
+        app.data_columns = ["订单号", "转单号"]
+        app.order_column, app.tracking_column = "订单号", "转单号"
+    if args.label_format:
+        if args.label_format not in app.label_sizes:
+            raise SystemExit(f"未知标签格式: {args.label_format}")
+        app.label_format_var.set(args.label_format)
+
+    if args.soak:
+        return soak_main(app, orders, args)
+
+    stats = run_replay(app, orders, rate=args.rate)
+    print(f"工作目录: {workdir}  打印后端: {backend.name}")
+    print(f"扫码数: {stats['scans']}  失败: {stats['failures']}  总耗时: {stats['elapsed_s']:.3f}s")
+    print(f"吞吐量: {stats['throughput_per_s']:.1f} 次/秒")
+    print(f"排队延迟: 平均 {stats['queue_delay_mean_ms']:.2f}ms  最大 {stats['queue_delay_max_ms']:.2f}ms")
+    print(f"端到端延迟: p50 {stats['latency_p50_ms']:.2f}ms  p95 {stats['latency_p95_ms']:.2f}ms  "
+          f"p99 {stats['latency_p99_ms']:.2f}ms  最大 {stats['latency_max_ms']:.2f}ms")
+    return stats
+
+
+def soak_main(app, orders, args):
+    """浸泡测试：循环回放到指定扫码数，定期采样RSS和Python分配量，
+    预热后内存增长超过阈值则以非0状态退出"""
+    total = args.soak
+    scans = [orders[i % len(orders)] for i in range(total)]
+    monitor = app.memory_monitor
+    monitor.start_tracing()
+    sample_every = max(1, total // 20)
+    # 前10%视为预热（字体、模块缓存等一次性分配），之后的增长才算泄漏
+    warmup = max(1, total // 10)
+    samples = []
+    baseline = {}
+
+    def on_scan(done):
+        if done == warmup:
+            baseline['rss'] = monitor.sample()
+            baseline['traced'] = monitor.traced_bytes()
+            monitor.top_allocations()
+        if done % sample_every == 0 or done == total:
+            rss = monitor.sample()
+            traced = monitor.traced_bytes()
+            samples.append((done, rss, traced))
+            print(f"  {done:>7} 次  RSS {format_mb(rss)}  Python分配 {format_mb(traced)}", flush=True)
+
+    stats = run_replay(app, scans, rate=args.rate, on_scan=on_scan)
+    _, end_rss, end_traced = samples[-1]
+    rss_growth = end_rss - baseline['rss'] if end_rss is not None and baseline['rss'] is not None else 0
+    traced_growth = end_traced - baseline['traced']
+    print(f"扫码数: {stats['scans']}  失败: {stats['failures']}  吞吐量: {stats['throughput_per_s']:.1f} 次/秒")
+    print(f"RSS峰值: {format_mb(monitor.peak_rss)}  预热后RSS增长: {format_mb(rss_growth)}  "
+          f"Python分配增长: {format_mb(traced_growth)}")
+    print("预热后分配增长最多的位置:")
+    for line in monitor.top_allocations():
+        print(f"  {line}")
+    limit = args.soak_max_growth_mb * 1024 * 1024
+    if rss_growth > limit or traced_growth > limit:
+        raise SystemExit(f"浸泡测试失败：预热后内存增长超过 {args.soak_max_growth_mb}MB")
+    print("浸泡测试通过：内存保持平稳")
+    return stats
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="扫码出标签工具")
+    parser.add_argument('--replay', metavar='FILE', help="无界面回放压测：从文件读取订单号（每行一个）")
+    parser.add_argument('--rate', type=float, default=0.0, help="回放速率（次/秒），0表示尽可能快")
+    parser.add_argument('--excel', metavar='XLSX', help="回放时使用的订单表（缺省时由回放文件生成）")
+    parser.add_argument('--sink-dir', metavar='DIR', help="文件打印后端：把PDF复制到该目录（缺省为空打印后端）")
+    parser.add_argument('--workdir', metavar='DIR', help="回放时生成标签文件的目录（缺省为临时目录）")
+    parser.add_argument('--label-format', help="标签格式，如100x100")
+    parser.add_argument('--verbose', action='store_true', help="回放时把日志输出到stderr")
+    parser.add_argument('--soak', type=int, metavar='N', help="浸泡测试：循环回放N次扫码并检查内存是否平稳")
+    parser.add_argument('--soak-max-growth-mb', type=float, default=20.0, help="浸泡测试允许的预热后内存增长（MB）")
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
-    root = tk.Tk()
-    app = BarcodeLabelTool(root)
-    root.mainloop()
+    args = parse_args()
+    if args.soak is not None and not args.replay:
+        raise SystemExit("--soak 需要与 --replay 一起使用")
+    if args.soak is not None and args.soak <= 0:
+        raise SystemExit("--soak 必须为正整数")
+    if args.replay:
+        replay_main(args)
+    else:
+        root = tk.Tk()
+        app = BarcodeLabelTool(root)
+        root.mainloop()